@@ -0,0 +1,220 @@
+"""Shared REST Countries and Gemini helpers used by the pages in this app."""
+import hashlib
+import threading
+
+import orjson
+import requests
+import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+BASE_URL = "https://restcountries.com/v3.1"
+# (connect, read) seconds: give up quickly on an unreachable host instead of
+# tying up the script thread and a pool connection. Every request made through
+# get_session() should pass this. Together with the retry policy below, a dead
+# host costs at most ~10 s per request (three 3 s connect attempts) and a
+# stalled one 7 s (reads are not retried).
+REQUEST_TIMEOUT = (3, 7)
+
+def _build_session() -> requests.Session:
+    """Session with a bigger keep-alive pool, retries on 429/5xx and failed
+    connects (but not on slow reads), and the default headers set once instead
+    of per request."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=20,
+        pool_maxsize=20,
+        max_retries=Retry(
+            total=3,
+            connect=2,
+            read=0,
+            backoff_factor=0.2,
+            status_forcelist=[429, 500, 502, 503, 504],
+        ),
+    )
+    session.mount("https://", adapter)
+    session.headers.update({"User-Agent": "country-insights/1.0", "Accept": "application/json"})
+    return session
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """One HTTP session (and connection pool) for the whole process. Streamlit
+    re-runs page scripts on every interaction, so it lives here, cached, rather
+    than on any one page."""
+    return _build_session()
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    """Worker threads for overlapping API calls, reused across reruns instead of
+    spinning up a new pool every time a page runs. Five is enough to fetch
+    every region at once."""
+    return ThreadPoolExecutor(max_workers=5)
+
+# ---------- Country lookups ----------
+# Only ask the API for the fields the pages display / send to Gemini
+COUNTRY_FIELDS = "name,capital,region,subregion,population,area,languages,currencies,flag"
+
+def _country_block(c: dict) -> str:
+    """The text block describing one summarized country to the LLM."""
+    return (
+        f"Name: {c.get('name')} (official: {c.get('official_name')})\n"
+        f"Capital: {c.get('capital')}\n"
+        f"Region: {c.get('region')} | Subregion: {c.get('subregion')}\n"
+        f"Population: {c.get('population_fmt')}\n"
+        f"Area: {c.get('area_fmt')}\n"
+        f"Languages: {c.get('languages_text')}\n"
+        f"Currencies: {c.get('currencies_text')}\n"
+        f"Flag: {c.get('flag')}\n"
+    )
+
+def _summarize(c: dict) -> dict:
+    """Pull the fields we use out of a raw API record, in one pass."""
+    languages = list((c.get("languages") or {}).values())
+    currencies = list((c.get("currencies") or {}).keys())
+    population = c.get("population", 0)
+    area = c.get("area", 0)
+    summary = {
+        "name": c.get("name", {}).get("common"),
+        "official_name": c.get("name", {}).get("official"),
+        "capital": (c.get("capital") or ["Unknown"])[0],
+        "region": c.get("region", "Unknown"),
+        "subregion": c.get("subregion", "Unknown"),
+        "population": population,
+        "area": area,
+        "languages": languages,
+        "currencies": currencies,
+        # Formatted / joined once here rather than every time the country is shown
+        "population_fmt": f"{population:,}",
+        "area_fmt": f"{area:,} km²",
+        "languages_text": ", ".join(languages) or "Unknown",
+        "currencies_text": ", ".join(currencies) or "Unknown",
+        "flag": c.get("flag", ""),
+    }
+    # The LLM text only depends on the fields above, so build it once per fetch too
+    summary["llm_block"] = _country_block(summary)
+    return summary
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
+def _fetch_country(name: str) -> dict | None:
+    """Fetch one country from the API. Cached for an hour per (normalized) name.
+
+    A 404 means the country doesn't exist, so that None is worth caching. Any
+    other failure raises instead, which keeps it out of the cache.
+    """
+    resp = get_session().get(f"{BASE_URL}/name/{name}?fields={COUNTRY_FIELDS}", timeout=REQUEST_TIMEOUT)
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+
+    data = orjson.loads(resp.content)
+    return _summarize(data[0]) if data else None
+
+def normalize_country_name(name) -> str:
+    """Canonical form of a typed country name, so "France", "france" and
+    "France " all share one cache entry."""
+    return (name or "").strip().lower()
+
+def get_country_data(name: str):
+    """Fetch structured data for a single country."""
+    key = normalize_country_name(name)
+    if not key:
+        # Blank / whitespace-only input: skip the request entirely
+        return None
+
+    try:
+        return _fetch_country(key)
+    except (requests.RequestException, orjson.JSONDecodeError):
+        # Timeouts, DNS/TLS errors, 5xx... show "not found" for now and retry next run
+        return None
+
+def format_country_block(c: dict) -> str:
+    """Format a single country's data as text for the LLM."""
+    if not c:
+        return "No data available."
+
+    # Prebuilt by _summarize; only a dict from elsewhere needs formatting here
+    return c.get("llm_block") or _country_block(c)
+
+# ---------- Gemini model ----------
+# Both Gemini pages use this model, so a name that works for one works for both
+GEMINI_MODEL_NAME = "gemini-flash-latest"
+
+@st.cache_resource
+def get_gemini_model(model_name: str = GEMINI_MODEL_NAME):
+    """Configure Gemini and build the model once per process instead of on every rerun.
+    The SDK is imported here, not at the top, so a page draws before it loads."""
+    import google.generativeai as genai
+
+    genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
+    return genai.GenerativeModel(model_name)
+
+# ---------- Gemini reply cache ----------
+REPLY_CACHE_SIZE = 256
+
+@st.cache_resource
+def _reply_cache() -> dict:
+    """Finished Gemini replies keyed by a hash of the prompt, shared by every
+    session and page. (Streamed replies can't go through st.cache_data, so the
+    pages remember repeats here.)"""
+    return {}
+
+_reply_cache_lock = threading.Lock()
+
+def _prompt_key(prompt: str) -> str:
+    return hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).hexdigest()
+
+def get_cached_reply(prompt: str) -> str | None:
+    """The reply Gemini gave for exactly this prompt before, or None."""
+    return _reply_cache().get(_prompt_key(prompt))
+
+def cache_reply(prompt: str, reply: str) -> None:
+    """Remember a complete reply, dropping the oldest once the cache is full."""
+    cache = _reply_cache()
+    with _reply_cache_lock:
+        if len(cache) >= REPLY_CACHE_SIZE:
+            cache.pop(next(iter(cache)), None)
+        cache[_prompt_key(prompt)] = reply
+
+# ---------- Gemini streaming ----------
+class EmptyReplyError(Exception):
+    """Gemini finished without sending any text (blocked, or cut off before
+    the first word)."""
+
+def _chunk_text(chunk) -> str:
+    """The text in one streamed chunk, or "" for a chunk with no parts. (chunk.text
+    raises ValueError for those, e.g. a final STOP chunk or a safety block.)"""
+    if not chunk.candidates:
+        return ""
+    return "".join(part.text for part in chunk.candidates[0].content.parts if part.text)
+
+def stream_reply(model, prompt: str, **generate_kwargs):
+    """Yield Gemini's reply to prompt as it is generated. A prompt that was already
+    answered is replayed from the cache in one piece, with no model call.
+
+    Raises EmptyReplyError if the whole stream had no text. Other API errors
+    propagate, possibly after some text has already been yielded. Only replies
+    that finished normally (STOP) are cached.
+    """
+    cached = get_cached_reply(prompt)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    finish_reason = None
+    for chunk in model.generate_content(prompt, stream=True, **generate_kwargs):
+        if chunk.candidates:
+            finish_reason = chunk.candidates[0].finish_reason
+        text = _chunk_text(chunk)
+        if text:
+            parts.append(text)
+            yield text
+
+    reply = "".join(parts).strip()
+    if not reply:
+        raise EmptyReplyError("Gemini returned no text")
+    # A reply cut off by MAX_TOKENS (or stopped for safety) is still shown, but
+    # isn't replayed to everyone else who sends the same prompt
+    if getattr(finish_reason, "name", None) == "STOP":
+        cache_reply(prompt, reply)
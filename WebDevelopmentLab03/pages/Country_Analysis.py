@@ -1,7 +1,10 @@
 import streamlit as st
 import requests
+import orjson
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from lib.country_api import BASE_URL, REQUEST_TIMEOUT, get_executor, get_session
 
 # Page configuration
 st.set_page_config(
@@ -10,8 +13,8 @@ st.set_page_config(
     layout="wide"
 )
 
-# Custom CSS for better styling
-st.markdown("""
+# Custom CSS for better styling, plus the dashboard title
+_PAGE_HEADER_HTML = """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -35,25 +38,145 @@ st.markdown("""
         margin: 0.5rem 0;
     }
 </style>
-""", unsafe_allow_html=True)
+<h1 class="main-header">🌍 Country Analysis Dashboard</h1>
+"""
+
+# Only ask the API for the fields this page reads
+COUNTRY_FIELDS = "name,population,area,region,capital,languages,flags"
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_countries(path):
+    """GET a REST Countries endpoint (e.g. "all" or "region/asia") and return the
+    decoded list, or None for a 404. Cached for an hour per endpoint; any other
+    failure (HTTP error or connection problem) raises, so it is never cached."""
+    response = get_session().get(
+        f"{BASE_URL}/{path}?fields={COUNTRY_FIELDS}", timeout=REQUEST_TIMEOUT
+    )
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+def fetch_region(region):
+    """Countries in one region, or an empty list if that request fails."""
+    try:
+        return fetch_countries(f"region/{region}") or []
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError):
+        return []
+
+# Shown when the API is unavailable; built once at import
+_SAMPLE_COUNTRIES = (
+    {
+        'name': {'common': 'United States', 'official': 'United States of America'},
+        'population': 331002651,
+        'area': 9833517,
+        'region': 'Americas',
+        'capital': ['Washington D.C.'],
+        'languages': {'eng': 'English'},
+        'flags': {'png': 'https://flagcdn.com/w320/us.png'}
+    },
+    {
+        'name': {'common': 'India', 'official': 'Republic of India'},
+        'population': 1380004385,
+        'area': 3287263,
+        'region': 'Asia',
+        'capital': ['New Delhi'],
+        'languages': {'hin': 'Hindi', 'eng': 'English'},
+        'flags': {'png': 'https://flagcdn.com/w320/in.png'}
+    },
+    {
+        'name': {'common': 'China', 'official': "People's Republic of China"},
+        'population': 1402112000,
+        'area': 9706961,
+        'region': 'Asia',
+        'capital': ['Beijing'],
+        'languages': {'zho': 'Chinese'},
+        'flags': {'png': 'https://flagcdn.com/w320/cn.png'}
+    },
+    {
+        'name': {'common': 'Brazil', 'official': 'Federative Republic of Brazil'},
+        'population': 212559417,
+        'area': 8515767,
+        'region': 'Americas',
+        'capital': ['Brasília'],
+        'languages': {'por': 'Portuguese'},
+        'flags': {'png': 'https://flagcdn.com/w320/br.png'}
+    },
+    {
+        'name': {'common': 'Germany', 'official': 'Federal Republic of Germany'},
+        'population': 83240525,
+        'area': 357114,
+        'region': 'Europe',
+        'capital': ['Berlin'],
+        'languages': {'deu': 'German'},
+        'flags': {'png': 'https://flagcdn.com/w320/de.png'}
+    },
+    {
+        'name': {'common': 'Nigeria', 'official': 'Federal Republic of Nigeria'},
+        'population': 206139587,
+        'area': 923768,
+        'region': 'Africa',
+        'capital': ['Abuja'],
+        'languages': {'eng': 'English'},
+        'flags': {'png': 'https://flagcdn.com/w320/ng.png'}
+    },
+    {
+        'name': {'common': 'Australia', 'official': 'Commonwealth of Australia'},
+        'population': 25499884,
+        'area': 7692024,
+        'region': 'Oceania',
+        'capital': ['Canberra'],
+        'languages': {'eng': 'English'},
+        'flags': {'png': 'https://flagcdn.com/w320/au.png'}
+    },
+    {
+        'name': {'common': 'Canada', 'official': 'Canada'},
+        'population': 38005238,
+        'area': 9984670,
+        'region': 'Americas',
+        'capital': ['Ottawa'],
+        'languages': {'eng': 'English', 'fra': 'French'},
+        'flags': {'png': 'https://flagcdn.com/w320/ca.png'}
+    },
+    {
+        'name': {'common': 'Japan', 'official': 'Japan'},
+        'population': 125836021,
+        'area': 377930,
+        'region': 'Asia',
+        'capital': ['Tokyo'],
+        'languages': {'jpn': 'Japanese'},
+        'flags': {'png': 'https://flagcdn.com/w320/jp.png'}
+    },
+    {
+        'name': {'common': 'France', 'official': 'French Republic'},
+        'population': 67391582,
+        'area': 551695,
+        'region': 'Europe',
+        'capital': ['Paris'],
+        'languages': {'fra': 'French'},
+        'flags': {'png': 'https://flagcdn.com/w320/fr.png'}
+    },
+)
 
 class CountryAnalyzer:
-    def __init__(self):
-        self.base_url = "https://restcountries.com/v3.1"
-        self.session = requests.Session()
-    
     def get_all_countries(self):
         """Fetch all countries data with multiple fallback methods"""
         try:
             with st.spinner('🌍 Fetching country data from around the world...'):
-                # Try the main endpoint first
-                response = self.session.get(f"{self.base_url}/all", timeout=10)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if data and len(data) > 0:
-                        st.success("✅ Live data loaded successfully!")
-                        return data
+                # Try the main endpoint first. If the API answers with an error
+                # (including retries exhausted on 5xx) or a body that isn't
+                # JSON, fall back to the regions.
+                try:
+                    data = fetch_countries("all")
+                except (
+                    requests.exceptions.HTTPError,
+                    requests.exceptions.RetryError,
+                    orjson.JSONDecodeError,
+                ):
+                    data = None
+                if data and len(data) > 0:
+                    st.success("✅ Live data loaded successfully!")
+                    return data
                 
                 # If main endpoint fails, try alternative approaches
                 return self.get_countries_by_regions()
@@ -67,14 +190,9 @@ class CountryAnalyzer:
         regions = ["africa", "americas", "asia", "europe", "oceania"]
         all_countries = []
         
-        for region in regions:
-            try:
-                response = self.session.get(f"{self.base_url}/region/{region}", timeout=10)
-                if response.status_code == 200:
-                    region_data = response.json()
-                    all_countries.extend(region_data)
-            except:
-                continue
+        # Request every region at once, so the wait is the slowest call, not the sum
+        for region_data in get_executor().map(fetch_region, regions):
+            all_countries.extend(region_data)
         
         if all_countries:
             st.success("✅ Live data loaded by regions!")
@@ -85,99 +203,29 @@ class CountryAnalyzer:
     
     def get_sample_data(self):
         """Provide sample data when API is unavailable"""
-        sample_countries = [
-            {
-                'name': {'common': 'United States', 'official': 'United States of America'},
-                'population': 331002651,
-                'area': 9833517,
-                'region': 'Americas',
-                'capital': ['Washington D.C.'],
-                'languages': {'eng': 'English'},
-                'flags': {'png': 'https://flagcdn.com/w320/us.png'}
-            },
-            {
-                'name': {'common': 'India', 'official': 'Republic of India'},
-                'population': 1380004385,
-                'area': 3287263,
-                'region': 'Asia',
-                'capital': ['New Delhi'],
-                'languages': {'hin': 'Hindi', 'eng': 'English'},
-                'flags': {'png': 'https://flagcdn.com/w320/in.png'}
-            },
-            {
-                'name': {'common': 'China', 'official': "People's Republic of China"},
-                'population': 1402112000,
-                'area': 9706961,
-                'region': 'Asia',
-                'capital': ['Beijing'],
-                'languages': {'zho': 'Chinese'},
-                'flags': {'png': 'https://flagcdn.com/w320/cn.png'}
-            },
-            {
-                'name': {'common': 'Brazil', 'official': 'Federative Republic of Brazil'},
-                'population': 212559417,
-                'area': 8515767,
-                'region': 'Americas',
-                'capital': ['Brasília'],
-                'languages': {'por': 'Portuguese'},
-                'flags': {'png': 'https://flagcdn.com/w320/br.png'}
-            },
-            {
-                'name': {'common': 'Germany', 'official': 'Federal Republic of Germany'},
-                'population': 83240525,
-                'area': 357114,
-                'region': 'Europe',
-                'capital': ['Berlin'],
-                'languages': {'deu': 'German'},
-                'flags': {'png': 'https://flagcdn.com/w320/de.png'}
-            },
-            {
-                'name': {'common': 'Nigeria', 'official': 'Federal Republic of Nigeria'},
-                'population': 206139587,
-                'area': 923768,
-                'region': 'Africa',
-                'capital': ['Abuja'],
-                'languages': {'eng': 'English'},
-                'flags': {'png': 'https://flagcdn.com/w320/ng.png'}
-            },
-            {
-                'name': {'common': 'Australia', 'official': 'Commonwealth of Australia'},
-                'population': 25499884,
-                'area': 7692024,
-                'region': 'Oceania',
-                'capital': ['Canberra'],
-                'languages': {'eng': 'English'},
-                'flags': {'png': 'https://flagcdn.com/w320/au.png'}
-            },
-            {
-                'name': {'common': 'Canada', 'official': 'Canada'},
-                'population': 38005238,
-                'area': 9984670,
-                'region': 'Americas',
-                'capital': ['Ottawa'],
-                'languages': {'eng': 'English', 'fra': 'French'},
-                'flags': {'png': 'https://flagcdn.com/w320/ca.png'}
-            },
-            {
-                'name': {'common': 'Japan', 'official': 'Japan'},
-                'population': 125836021,
-                'area': 377930,
-                'region': 'Asia',
-                'capital': ['Tokyo'],
-                'languages': {'jpn': 'Japanese'},
-                'flags': {'png': 'https://flagcdn.com/w320/jp.png'}
-            },
-            {
-                'name': {'common': 'France', 'official': 'French Republic'},
-                'population': 67391582,
-                'area': 551695,
-                'region': 'Europe',
-                'capital': ['Paris'],
-                'languages': {'fra': 'French'},
-                'flags': {'png': 'https://flagcdn.com/w320/fr.png'}
-            }
-        ]
-        return sample_countries
+        return _SAMPLE_COUNTRIES
+
+def build_country_df(countries_data):
+    """Flatten the raw country list into one DataFrame (name, population, area,
+    region, density) in a single pass. The index is each country's position in
+    countries_data; density is NaN where the area is unknown."""
+    records = [
+        (
+            country.get('name', {}).get('common', 'Unknown'),
+            country.get('population', 0),
+            country.get('area', 0),
+            country.get('region', 'Unknown'),
+        )
+        for country in countries_data
+    ]
+    df = pd.DataFrame.from_records(records, columns=['name', 'population', 'area', 'region'])
+    # A handful of regions repeated across every row: store them as small integer
+    # codes so the region filter and groupbys compare ints, not strings
+    df['region'] = df['region'].astype('category')
+    population = df['population'].to_numpy(dtype=float)
+    area = df['area'].to_numpy(dtype=float)
+    df['density'] = np.divide(population, area, out=np.full(len(df), np.nan), where=area > 0)
+    return df
 
 def format_population(population):
     """Format population numbers with commas and appropriate units"""
@@ -190,51 +238,57 @@ def format_population(population):
     else:
         return f"{population:,}"
 
-def create_population_table(countries_data, selected_countries):
+def format_population_series(population):
+    """Vectorized format_population for a whole column of values"""
+    values = population.to_numpy(dtype=float)
+    formatted = np.select(
+        [values >= 1_000_000_000, values >= 1_000_000, values >= 1_000],
+        [
+            np.char.mod("%.2fB", values / 1_000_000_000),
+            np.char.mod("%.2fM", values / 1_000_000),
+            np.char.mod("%.1fK", values / 1_000),
+        ],
+        default="",
+    ).astype(object)
+    # Values under 1,000 keep their own type (int vs float), like format_population
+    small = values < 1_000
+    if small.any():
+        formatted[small] = population[small].map('{:,}'.format).to_numpy()
+    return pd.Series(formatted, index=population.index)
+
+def create_population_table(country_df, selected_countries):
     """Create a table showing population comparison"""
-    filtered_data = []
-    for country in countries_data:
-        country_name = country.get('name', {}).get('common', 'Unknown')
-        if country_name in selected_countries:
-            filtered_data.append({
-                'Country': country_name,
-                'Population': country.get('population', 0),
-                'Formatted Population': format_population(country.get('population', 0)),
-                'Region': country.get('region', 'Unknown'),
-                'Area (km²)': f"{country.get('area', 0):,}" if country.get('area', 0) > 0 else 'Unknown',
-                'Density (/km²)': f"{(country.get('population', 0) / country.get('area', 1)):,.1f}" if country.get('area', 0) > 0 else 'Unknown'
-            })
-    
-    if not filtered_data:
+    rows = country_df[country_df['name'].isin(selected_countries)]
+    if rows.empty:
         return None
     
-    df = pd.DataFrame(filtered_data)
-    return df[['Country', 'Formatted Population', 'Region', 'Area (km²)', 'Density (/km²)']]
+    has_area = rows['area'] > 0
+    df = pd.DataFrame({
+        'Country': rows['name'],
+        'Formatted Population': format_population_series(rows['population']),
+        'Region': rows['region'],
+        'Area (km²)': rows['area'].map('{:,}'.format).where(has_area, 'Unknown'),
+        'Density (/km²)': rows['density'].map('{:,.1f}'.format).where(has_area, 'Unknown'),
+    })
+    return df.reset_index(drop=True)
 
-def create_region_summary(countries_data):
+def create_region_summary(country_df):
     """Create a summary table of regions"""
-    regions = {}
-    for country in countries_data:
-        region = country.get('region', 'Unknown')
-        if region not in regions:
-            regions[region] = {'count': 0, 'population': 0, 'area': 0}
-        
-        regions[region]['count'] += 1
-        regions[region]['population'] += country.get('population', 0)
-        regions[region]['area'] += country.get('area', 0)
-    
-    summary_data = []
-    for region, stats in regions.items():
-        avg_population = stats['population'] / stats['count'] if stats['count'] > 0 else 0
-        summary_data.append({
-            'Region': region,
-            'Countries': stats['count'],
-            'Total Population': format_population(stats['population']),
-            'Average Population': format_population(avg_population),
-            'Total Area (km²)': f"{stats['area']:,}"
-        })
-    
-    return pd.DataFrame(summary_data)
+    # One grouped pass; sort=False keeps regions in first-seen order
+    stats = country_df.groupby('region', sort=False, observed=True).agg(
+        count=('population', 'size'),
+        population=('population', 'sum'),
+        avg_population=('population', 'mean'),
+        area=('area', 'sum'),
+    )
+    
+    return pd.DataFrame({
+        'Region': stats.index,
+        'Countries': stats['count'].to_numpy(),
+        'Total Population': format_population_series(stats['population']).to_numpy(),
+        'Average Population': format_population_series(stats['avg_population']).to_numpy(),
+        'Total Area (km²)': stats['area'].map('{:,}'.format).to_numpy(),
+    })
 
 def display_country_details(country):
     """Display individual country information in a clean layout"""
@@ -307,7 +361,9 @@ def display_country_details(country):
             )
 
 def main():
-    st.markdown('<h1 class="main-header">🌍 Country Analysis Dashboard</h1>', unsafe_allow_html=True)
+    # Custom CSS + page header, sent as one element. (Sending it only on the first
+    # run doesn't work: Streamlit removes anything a rerun doesn't emit again.)
+    st.markdown(_PAGE_HEADER_HTML, unsafe_allow_html=True)
     
     # Initialize analyzer
     analyzer = CountryAnalyzer()
@@ -360,40 +416,35 @@ def main():
         """)
         return
     
-    # Filter and sort data based on user inputs
-    filtered_countries = []
-    for country in countries_data:
-        population = country.get('population', 0)
-        region = country.get('region', '')
-        
-        # Apply filters
-        if selected_region != "All" and region != selected_region:
-            continue
-        if population < min_population:
-            continue
-            
-        filtered_countries.append(country)
-    
-    # Sort based on user selection
-    if sort_by == "Population":
-        filtered_countries.sort(key=lambda x: x.get('population', 0), reverse=True)
-    elif sort_by == "Area":
-        filtered_countries.sort(key=lambda x: x.get('area', 0), reverse=True)
-    else:  # Name
-        filtered_countries.sort(key=lambda x: x.get('name', {}).get('common', ''))
-    
-    # Limit number of countries
-    filtered_countries = filtered_countries[:country_limit]
+    # Filter and sort data based on user inputs, as column operations on the DataFrame
+    country_df = build_country_df(countries_data)
+    mask = country_df['population'] >= min_population
+    if selected_region != "All":
+        mask &= country_df['region'] == selected_region
+    
+    # Population / Area sort descending, Name ascending; then limit number of countries
+    filtered_df = (
+        country_df[mask]
+        .sort_values(sort_by.lower(), ascending=(sort_by == "Name"), kind="stable")
+        .head(country_limit)
+    )
+    filtered_countries = [countries_data[i] for i in filtered_df.index]
+    # Names for the selectors in all tabs, in display order, and a lookup back to
+    # the raw record (the first country wins if two share a name)
+    country_names = filtered_df['name'].tolist()
+    country_by_name = {}
+    for name, country in zip(country_names, filtered_countries):
+        country_by_name.setdefault(name, country)
     
     # Display summary metrics
     st.subheader("📊 Global Overview")
     
     col1, col2, col3, col4 = st.columns(4)
     
-    total_countries = len(filtered_countries)
-    total_population = sum(country.get('population', 0) for country in filtered_countries)
+    total_countries = len(filtered_df)
+    total_population = int(filtered_df['population'].sum())
     avg_population = total_population / total_countries if total_countries > 0 else 0
-    total_area = sum(country.get('area', 0) for country in filtered_countries)
+    total_area = filtered_df['area'].sum()
     
     with col1:
         st.metric("Countries Analyzed", total_countries)
@@ -412,11 +463,10 @@ def main():
         
         if filtered_countries:
             # Country selector
-            country_names = [country.get('name', {}).get('common', 'Unknown') for country in filtered_countries]
             selected_country = st.selectbox("Select a country to view details:", country_names)
             
             if selected_country:
-                country_data = next((c for c in filtered_countries if c.get('name', {}).get('common') == selected_country), None)
+                country_data = country_by_name.get(selected_country)
                 if country_data:
                     display_country_details(country_data)
         else:
@@ -433,12 +483,12 @@ def main():
                 st.subheader("📊 Population Comparison")
                 selected_for_table = st.multiselect(
                     "Select countries to compare:",
-                    [c.get('name', {}).get('common', 'Unknown') for c in filtered_countries],
-                    default=[c.get('name', {}).get('common', 'Unknown') for c in filtered_countries[:3]]
+                    country_names,
+                    default=country_names[:3]
                 )
                 
                 if selected_for_table:
-                    pop_table = create_population_table(filtered_countries, selected_for_table)
+                    pop_table = create_population_table(filtered_df, selected_for_table)
                     if pop_table is not None:
                         st.dataframe(pop_table, use_container_width=True)
                     else:
@@ -449,24 +499,24 @@ def main():
             with col2:
                 # Quick statistics
                 st.subheader("📈 Quick Stats")
-                if filtered_countries:
-                    largest_country = max(filtered_countries, key=lambda x: x.get('population', 0))
-                    smallest_country = min(filtered_countries, key=lambda x: x.get('population', 0))
+                if not filtered_df.empty:
+                    largest_country = filtered_df.loc[filtered_df['population'].idxmax()]
+                    smallest_country = filtered_df.loc[filtered_df['population'].idxmin()]
                     
                     st.metric(
                         "Largest Population", 
-                        f"{largest_country.get('name', {}).get('common', 'Unknown')} ({format_population(largest_country.get('population', 0))})"
+                        f"{largest_country['name']} ({format_population(largest_country['population'])})"
                     )
                     st.metric(
                         "Smallest Population", 
-                        f"{smallest_country.get('name', {}).get('common', 'Unknown')} ({format_population(smallest_country.get('population', 0))})"
+                        f"{smallest_country['name']} ({format_population(smallest_country['population'])})"
                     )
                     
                     # Area comparison
-                    largest_area = max(filtered_countries, key=lambda x: x.get('area', 0))
+                    largest_area = filtered_df.loc[filtered_df['area'].idxmax()]
                     st.metric(
                         "Largest Area", 
-                        f"{largest_area.get('name', {}).get('common', 'Unknown')} ({largest_area.get('area', 0):,} km²)"
+                        f"{largest_area['name']} ({largest_area['area']:,} km²)"
                     )
         else:
             st.info("Select at least 2 countries to see data analysis features.")
@@ -475,24 +525,21 @@ def main():
         st.subheader("Regional Insights")
         
         # Regional statistics table
-        region_table = create_region_summary(countries_data)
+        region_table = create_region_summary(country_df)
         if not region_table.empty:
             st.subheader("🌍 Regional Summary")
             st.dataframe(region_table, use_container_width=True)
         
         # Regional breakdown
         st.subheader("Regional Distribution")
-        region_counts = {}
-        for country in filtered_countries:
-            region = country.get('region', 'Unknown')
-            region_counts[region] = region_counts.get(region, 0) + 1
+        region_counts = filtered_df.groupby('region', sort=False, observed=True).size()
         
-        if region_counts:
+        if not region_counts.empty:
             for region, count in region_counts.items():
                 st.write(f"**{region}**: {count} countries")
                 # Simple bar using text (since we don't have plotly)
-                bar_length = int((count / len(filtered_countries)) * 50)
-                st.write("▮" * bar_length + f" ({count/len(filtered_countries)*100:.1f}%)")
+                bar_length = int((count / total_countries) * 50)
+                st.write("▮" * bar_length + f" ({count/total_countries*100:.1f}%)")
         else:
             st.info("Regional data will be displayed when countries are available.")
 
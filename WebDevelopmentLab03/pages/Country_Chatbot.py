@@ -1,6 +1,7 @@
+import logging
+
 import streamlit as st
-import requests
-import google.generativeai as genai
+from lib.country_api import EmptyReplyError, get_country_data, get_gemini_model, stream_reply
 
 # ---------- Page config ----------
 st.set_page_config(
@@ -16,121 +17,107 @@ st.write(
 )
 
 # ---------- Configure Gemini ----------
+logger = logging.getLogger(__name__)
+
 try:
-    genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
-    model = genai.GenerativeModel("gemini-flash-latest")
+    model = get_gemini_model()
     GEMINI_READY = True
-except Exception as e:
+except Exception:
     GEMINI_READY = False
+    # Full details go to the server log; the page just gets one short message
+    logger.exception("Gemini config failed")
     st.error("⚠️ Gemini is not configured correctly. Please set GEMINI_API_KEY in Streamlit secrets.")
-    st.error(f"Debug info (Gemini config): {e}")
-
-# ---------- REST Countries Helper ----------
-BASE_URL = "https://restcountries.com/v3.1"
-
-def get_country_data(country_name: str):
-    """Fetch structured country data from REST Countries API."""
-    if not country_name:
-        return None
-
-    try:
-        response = requests.get(f"{BASE_URL}/name/{country_name}", timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            if data:
-                country = data[0]
-                return {
-                    "name": country.get("name", {}).get("common"),
-                    "official_name": country.get("name", {}).get("official"),
-                    "capital": country.get("capital", ["Unknown"])[0],
-                    "region": country.get("region", "Unknown"),
-                    "subregion": country.get("subregion", "Unknown"),
-                    "population": country.get("population", 0),
-                    "area": country.get("area", 0),
-                    "languages": list((country.get("languages") or {}).values()),
-                    "currencies": list((country.get("currencies") or {}).keys()),
-                    "flag_emoji": country.get("flag", "")
-                }
-    except Exception:
-        # If anything goes wrong with the API, just return None
-        return None
-
-    return None
 
 # ---------- Prompt Builder ----------
-def build_prompt(chat_history, country_data, user_message):
-    """Builds a complete prompt for Gemini with structured data + chat history."""
-    system_instructions = (
-        "You are a helpful assistant that answers questions about countries using data from the "
-        "REST Countries API. If a detail is not included in the provided data, you may answer from "
-        "general knowledge but state that it is not directly from the API. Keep responses clear, "
-        "accurate, and friendly."
-    )
-
-    # Convert chat history into a readable transcript
-    history_str = ""
-    for msg in chat_history:
-        history_str += f"{msg['role'].upper()}: {msg['content']}\n"
-
-    # Structured data section
-    if country_data:
-        country_info_str = f"""
-Country data from REST Countries API:
-- Name: {country_data.get('name')}
-- Official Name: {country_data.get('official_name')}
-- Capital: {country_data.get('capital')}
-- Region: {country_data.get('region')}
-- Subregion: {country_data.get('subregion')}
-- Population: {country_data.get('population')}
-- Area: {country_data.get('area')} km²
-- Languages: {', '.join(country_data.get('languages', []))}
-- Currencies: {', '.join(country_data.get('currencies', []))}
-- Flag: {country_data.get('flag_emoji', '')}
-"""
-    else:
-        country_info_str = "No country data available."
+# Messages of history included in each prompt: the new question plus the three
+# exchanges before it. Kept odd so the window always starts on a user message.
+HISTORY_WINDOW = 7
+
+# The fixed parts of every prompt, built once at import
+SYSTEM_INSTRUCTIONS = (
+    "You are a helpful assistant that answers questions about countries using data from the "
+    "REST Countries API. If a detail is not included in the provided data, you may answer from "
+    "general knowledge but state that it is not directly from the API. Keep responses clear, "
+    "accurate, and friendly."
+)
 
-    # Final prompt
-    prompt = f"""
+PROMPT_TEMPLATE = """
 {system_instructions}
 
 Conversation so far:
-{history_str}
+{history}
 
 Structured REST Countries API info:
-{country_info_str}
+{country_info}
 
 User's latest question:
 {user_message}
 
 Now respond as the assistant.
 """
-    return prompt
+
+def build_prompt(chat_history, country_data, user_message):
+    """Builds a complete prompt for Gemini with structured data + chat history."""
+
+    # Convert the recent chat history into a readable transcript. Only the last
+    # few messages are sent, so the prompt (and Gemini's latency) stays bounded
+    # instead of growing with every turn. This also means a cached reply is
+    # reused whenever the last few turns match, not only the whole conversation.
+    recent = chat_history[-HISTORY_WINDOW:]
+    history_str = "".join(f"{msg['role'].upper()}: {msg['content']}\n" for msg in recent)
+
+    # Structured data section
+    if country_data:
+        fields = {
+            "Name": country_data.get("name"),
+            "Official Name": country_data.get("official_name"),
+            "Capital": country_data.get("capital"),
+            "Region": country_data.get("region"),
+            "Subregion": country_data.get("subregion"),
+            "Population": country_data.get("population"),
+            "Area": f"{country_data.get('area')} km²",
+            "Languages": ", ".join(country_data.get("languages", [])),
+            "Currencies": ", ".join(country_data.get("currencies", [])),
+            "Flag": country_data.get("flag", ""),
+        }
+        lines = "\n".join(f"- {label}: {value}" for label, value in fields.items())
+        country_info_str = f"\nCountry data from REST Countries API:\n{lines}\n"
+    else:
+        country_info_str = "No country data available."
+
+    return PROMPT_TEMPLATE.format(
+        system_instructions=SYSTEM_INSTRUCTIONS,
+        history=history_str,
+        country_info=country_info_str,
+        user_message=user_message,
+    )
 
 # ---------- Gemini API Wrapper ----------
-def ask_gemini(prompt: str) -> str:
+def ask_gemini(prompt: str):
     """
-    Safely call Gemini.
+    Safely call Gemini, yielding the reply in chunks for st.write_stream.
     - If Gemini isn't configured, tell the user.
+    - If this exact prompt was answered before, reuse that reply.
     - If Gemini throws an error, show the real error (for debugging) AND a friendly message.
     """
     if not GEMINI_READY:
-        return "Gemini is not available because the API key is not configured."
+        yield "Gemini is not available because the API key is not configured."
+        return
 
+    streamed = False
     try:
-        response = model.generate_content(prompt)
-
-        # Extra safety: sometimes response.text can be None
-        if not hasattr(response, "text") or response.text is None:
-            return "Gemini returned an empty response. Try asking in a different way."
-
-        return response.text.strip()
-
+        for text in stream_reply(model, prompt):
+            streamed = True
+            yield text
+    except EmptyReplyError:
+        # Sometimes Gemini sends back no text at all
+        yield "Gemini returned an empty response. Try asking in a different way."
     except Exception as e:
         # Show the real error in the UI for debugging
         st.error(f"Gemini API error: {e}")
-        # Return a friendly message for the chat (assignment wants error handling)
-        return (
+        # Return a friendly message for the chat (assignment wants error handling),
+        # kept apart from any text that already arrived
+        yield ("\n\n" if streamed else "") + (
             "Sorry, something went wrong while contacting the AI. "
             "Please try again in a moment."
         )
@@ -173,8 +160,9 @@ if user_message:
         user_message=user_message
     )
 
-    # Ask Gemini
-    assistant_reply = ask_gemini(prompt)
+    # Ask Gemini and display the reply as it arrives
+    with st.chat_message("assistant"):
+        assistant_reply = st.write_stream(ask_gemini(prompt)).strip()
 
     # Save assistant message
     st.session_state.chat_history.append({
@@ -182,10 +170,6 @@ if user_message:
         "content": assistant_reply
     })
 
-    # Display assistant message
-    with st.chat_message("assistant"):
-        st.markdown(assistant_reply)
-
 # ---------- Footer ----------
 st.markdown("---")
 st.caption("💡 Phase 4: Country Chatbot • Powered by Google Gemini and REST Countries API")
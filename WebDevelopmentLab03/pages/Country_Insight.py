@@ -1,6 +1,15 @@
+import logging
+
 import streamlit as st
-import requests
-import google.generativeai as genai
+from lib.country_api import (
+    EmptyReplyError,
+    format_country_block,
+    get_country_data,
+    get_executor,
+    get_gemini_model,
+    normalize_country_name,
+    stream_reply,
+)
 
 # ---------- Page config ----------
 st.set_page_config(
@@ -18,91 +27,48 @@ with st.container():
     )
 
 # ---------- Configure Gemini ----------
-try:
-    genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
-
-    # IMPORTANT:
-    # Use the SAME model name here that works in your chatbot page.
-    # If your chatbot works with "gemini-1.5-flash", use that instead.
-    INSIGHT_MODEL_NAME = "gemini-flash-latest"
-    insight_model = genai.GenerativeModel(INSIGHT_MODEL_NAME)
+logger = logging.getLogger(__name__)
 
+try:
+    insight_model = get_gemini_model()
     GEMINI_READY = True
-except Exception as e:
+except Exception:
     GEMINI_READY = False
+    # Full details go to the server log; the page just gets one short message
+    logger.exception("Gemini config failed")
     st.error("⚠️ Gemini is not configured correctly for Country Insight.")
-    st.error(f"Debug info (Gemini config): {e}")
 
-# ---------- REST Countries Helper ----------
-BASE_URL = "https://restcountries.com/v3.1"
-
-def get_country_data(name: str):
-    """Fetch structured data for a single country."""
-    if not name:
-        return None
-
-    try:
-        resp = requests.get(f"{BASE_URL}/name/{name}", timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            if data:
-                c = data[0]
-                return {
-                    "name": c.get("name", {}).get("common"),
-                    "official_name": c.get("name", {}).get("official"),
-                    "capital": c.get("capital", ["Unknown"])[0],
-                    "region": c.get("region", "Unknown"),
-                    "subregion": c.get("subregion", "Unknown"),
-                    "population": c.get("population", 0),
-                    "area": c.get("area", 0),
-                    "languages": list((c.get("languages") or {}).values()),
-                    "currencies": list((c.get("currencies") or {}).keys()),
-                    "flag": c.get("flag", ""),
-                }
-    except Exception:
-        return None
-
-    return None
-
-def format_country_block(c: dict) -> str:
-    """Format a single country's data as text for the LLM."""
-    if not c:
-        return "No data available."
-
-    return (
-        f"Name: {c.get('name')} (official: {c.get('official_name')})\n"
-        f"Capital: {c.get('capital')}\n"
-        f"Region: {c.get('region')} | Subregion: {c.get('subregion')}\n"
-        f"Population: {c.get('population'):,}\n"
-        f"Area: {c.get('area'):,} km²\n"
-        f"Languages: {', '.join(c.get('languages', [])) or 'Unknown'}\n"
-        f"Currencies: {', '.join(c.get('currencies', [])) or 'Unknown'}\n"
-        f"Flag: {c.get('flag')}\n"
-    )
+# ---------- Display Helper ----------
+def show_country_data(c: dict):
+    """Render one country's data in the Data View tab."""
+    st.write(f"**{c['name']}** {c.get('flag', '')}")
+    st.write(f"**Capital:** {c['capital']}")
+    st.write(f"**Region:** {c['region']} — {c['subregion']}")
+    st.write(f"**Population:** {c['population_fmt']}")
+    st.write(f"**Area:** {c['area_fmt']}")
+    st.write(f"**Languages:** {c['languages_text']}")
+    st.write(f"**Currencies:** {c['currencies_text']}")
 
 # ---------- Gemini Wrapper ----------
-def generate_country_insight(primary_data, secondary_data, insight_type, detail_level, extra_note):
-    """Call Gemini to generate a structured insight based on country data."""
-    if not GEMINI_READY:
-        return "Gemini is not available right now. Please check the API key configuration."
-
-    system_instructions = (
-        "You are an assistant that analyzes REST Countries API data. "
-        "You must base concrete facts (like population, capital, region, area) on the provided data. "
-        "If something is not in the data, say you are not sure instead of guessing. "
-        "Write clearly, in paragraphs, and stay friendly and informative."
-    )
+# The fixed parts of every insight prompt, built once at import
+SYSTEM_INSTRUCTIONS = (
+    "You are an assistant that analyzes REST Countries API data. "
+    "You must base concrete facts (like population, capital, region, area) on the provided data. "
+    "If something is not in the data, say you are not sure instead of guessing. "
+    "Write clearly, in paragraphs, and stay friendly and informative."
+)
 
-    primary_block = format_country_block(primary_data)
-    secondary_block = format_country_block(secondary_data) if secondary_data else "No comparison country provided."
+DETAIL_TEXT = {
+    1: "very short, 2–3 sentence overview",
+    2: "medium-length explanation, around one short paragraph",
+    3: "more detailed, 2–3 short paragraphs with key facts and commentary",
+}
 
-    detail_text = {
-        1: "very short, 2–3 sentence overview",
-        2: "medium-length explanation, around one short paragraph",
-        3: "more detailed, 2–3 short paragraphs with key facts and commentary",
-    }[detail_level]
+# No max_output_tokens cap per level: gemini-flash-latest is a thinking model,
+# and its thinking tokens count against the cap, so a small one could use up
+# the whole budget before any text. DETAIL_TEXT asks for the length instead.
 
-    prompt = f"""
+PROMPT_TEMPLATE = """
 {system_instructions}
 
 Insight type requested: {insight_type}
@@ -115,72 +81,120 @@ Comparison country data:
 {secondary_block}
 
 Additional user note or focus:
-{extra_note or "None."}
+{extra_note}
 
 Now write the requested insight in a way that would make sense to a student exploring these countries.
 """
 
+def generate_country_insight(primary_data, secondary_data, insight_type, detail_level, extra_note):
+    """Call Gemini to generate a structured insight based on country data.
+    Yields the text in chunks so it can be shown with st.write_stream."""
+    if not GEMINI_READY:
+        yield "Gemini is not available right now. Please check the API key configuration."
+        return
+
+    primary_block = format_country_block(primary_data)
+    secondary_block = format_country_block(secondary_data) if secondary_data else "No comparison country provided."
+
+    prompt = PROMPT_TEMPLATE.format(
+        system_instructions=SYSTEM_INSTRUCTIONS,
+        insight_type=insight_type,
+        detail_text=DETAIL_TEXT[detail_level],
+        primary_block=primary_block,
+        secondary_block=secondary_block,
+        extra_note=extra_note or "None.",
+    )
+
+    streamed = False
     try:
-        response = insight_model.generate_content(prompt)
-        if not hasattr(response, "text") or response.text is None:
-            return "I couldn't generate an insight. Try changing your inputs or trying again."
-        return response.text.strip()
+        for text in stream_reply(insight_model, prompt):
+            streamed = True
+            yield text
+    except EmptyReplyError:
+        yield "I couldn't generate an insight. Try changing your inputs or trying again."
     except Exception as e:
         st.error(f"Gemini API error (Country Insight): {e}")
-        return "Sorry, something went wrong while generating the insight. Please try again."
+        # Keep any text that already arrived apart from the apology
+        yield ("\n\n" if streamed else "") + (
+            "Sorry, something went wrong while generating the insight. Please try again."
+        )
 
 # ---------- Sidebar Inputs (Phase 3 requirements) ----------
 st.sidebar.header("Country Insight Settings")
 
-primary_country = st.sidebar.text_input(
-    "Primary country",
-    value="France",
-    help="This is the main country the insight will focus on."
-)
+# The settings are a form, so typing a note or dragging the slider doesn't rerun
+# the page on every change; everything is applied together on submit.
+with st.sidebar.form("insight_settings"):
+    primary_country = st.text_input(
+        "Primary country",
+        value="France",
+        help="This is the main country the insight will focus on."
+    )
 
-compare_mode = st.sidebar.checkbox(
-    "Add a comparison country?",
-    value=False
-)
+    compare_mode = st.checkbox(
+        "Add a comparison country?",
+        value=False
+    )
 
-secondary_country = None
-if compare_mode:
-    secondary_country = st.sidebar.text_input(
+    # Always shown: inside a form, ticking the box above doesn't rerun the page
+    # until the form is submitted
+    secondary_country = st.text_input(
         "Comparison country",
         value="Germany",
-        help="Optional: compare the primary country with this one."
+        help="Optional: used when the comparison box above is ticked."
+    )
+    if not compare_mode:
+        secondary_country = None
+
+    insight_type = st.selectbox(
+        "Type of insight",
+        [
+            "Travel-style overview",
+            "Economic & demographic snapshot",
+            "Culture, language, and region context",
+            "Why this country is interesting to visit or study",
+        ]
     )
 
-insight_type = st.sidebar.selectbox(
-    "Type of insight",
-    [
-        "Travel-style overview",
-        "Economic & demographic snapshot",
-        "Culture, language, and region context",
-        "Why this country is interesting to visit or study",
-    ]
-)
+    detail_level = st.slider(
+        "Detail level",
+        min_value=1,
+        max_value=3,
+        value=2,
+        format="%d",
+        help="1 = very short, 3 = more detailed"
+    )
 
-detail_level = st.sidebar.slider(
-    "Detail level",
-    min_value=1,
-    max_value=3,
-    value=2,
-    format="%d",
-    help="1 = very short, 3 = more detailed"
-)
+    extra_note = st.text_area(
+        "Optional focus or question",
+        placeholder="Example: Focus on safety and tourism. Or: Compare population density.",
+        height=80
+    )
 
-extra_note = st.sidebar.text_area(
-    "Optional focus or question",
-    placeholder="Example: Focus on safety and tourism. Or: Compare population density.",
-    height=80
-)
+    st.form_submit_button("Apply settings")
 
 # ---------- Fetch data once so we can reuse it ----------
-primary_data = get_country_data(primary_country)
-secondary_data = None
-if compare_mode and secondary_country:
-    secondary_data = get_country_data(secondary_country)
+primary_key = normalize_country_name(primary_country)
+secondary_key = normalize_country_name(secondary_country) if compare_mode else ""
+
+# Countries already loaded in this session are reused as-is, and the same
+# country typed in both boxes is only fetched once.
+country_cache = st.session_state.setdefault("country_cache", {})
+to_fetch = [key for key in dict.fromkeys([primary_key, secondary_key]) if key and key not in country_cache]
+
+if len(to_fetch) > 1:
+    # Look both countries up at the same time instead of one after the other
+    fetched = list(get_executor().map(get_country_data, to_fetch))
+else:
+    fetched = [get_country_data(key) for key in to_fetch]
+
+for key, data in zip(to_fetch, fetched):
+    # Misses aren't remembered, so a typo or network blip is retried next run
+    if data:
+        country_cache[key] = data
+
+primary_data = country_cache.get(primary_key)
+secondary_data = country_cache.get(secondary_key) if secondary_key else None
 
 # ---------- MAIN LAYOUT USING TABS + CONTAINERS ----------
 data_tab, insight_tab = st.tabs(["📊 Data View", "🧾 AI Insight"])
@@ -193,13 +207,7 @@ with data_tab:
         with col1:
             st.subheader("📌 Primary Country Data")
             if primary_data:
-                st.write(f"**{primary_data['name']}** {primary_data.get('flag', '')}")
-                st.write(f"**Capital:** {primary_data['capital']}")
-                st.write(f"**Region:** {primary_data['region']} — {primary_data['subregion']}")
-                st.write(f"**Population:** {primary_data['population']:,}")
-                st.write(f"**Area:** {primary_data['area']:,} km²")
-                st.write(f"**Languages:** {', '.join(primary_data['languages']) or 'Unknown'}")
-                st.write(f"**Currencies:** {', '.join(primary_data['currencies']) or 'Unknown'}")
+                show_country_data(primary_data)
             else:
                 st.warning(f"Could not load data for '{primary_country}'. Please check the spelling.")
 
@@ -207,13 +215,7 @@ with data_tab:
             st.subheader("📎 Comparison Country Data")
             if compare_mode and secondary_country:
                 if secondary_data:
-                    st.write(f"**{secondary_data['name']}** {secondary_data.get('flag', '')}")
-                    st.write(f"**Capital:** {secondary_data['capital']}")
-                    st.write(f"**Region:** {secondary_data['region']} — {secondary_data['subregion']}")
-                    st.write(f"**Population:** {secondary_data['population']:,}")
-                    st.write(f"**Area:** {secondary_data['area']:,} km²")
-                    st.write(f"**Languages:** {', '.join(secondary_data['languages']) or 'Unknown'}")
-                    st.write(f"**Currencies:** {', '.join(secondary_data['currencies']) or 'Unknown'}")
+                    show_country_data(secondary_data)
                 else:
                     st.warning(
                         f"Could not load data for '{secondary_country}'. "
@@ -237,16 +239,15 @@ with insight_tab:
             if not primary_data:
                 st.error("Please fix the primary country name before generating an insight.")
             else:
-                with st.spinner("Asking Gemini to analyze the country data..."):
-                    insight_text = generate_country_insight(
-                        primary_data=primary_data,
-                        secondary_data=secondary_data,
-                        insight_type=insight_type,
-                        detail_level=detail_level,
-                        extra_note=extra_note,
-                    )
                 st.markdown("### Insight")
-                st.write(insight_text)
+                # Text shows up as Gemini writes it instead of after a long spinner
+                st.write_stream(generate_country_insight(
+                    primary_data=primary_data,
+                    secondary_data=secondary_data,
+                    insight_type=insight_type,
+                    detail_level=detail_level,
+                    extra_note=extra_note,
+                ))
         else:
             st.info("Set your options in the sidebar, then click **Generate Country Insight** to see the AI output.")
 